@@ -1,130 +1,325 @@
 # app.py
-from flask import Flask, request, redirect, render_template_string
+from flask import Flask, request, redirect, send_file
+from flask_compress import Compress
 import sqlite3
-from typing import List, Tuple, Optional, Dict
-from openpyxl import Workbook, load_workbook
+from typing import List, Tuple, Optional, Dict, Iterator
+import xlsxwriter
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
+from contextlib import contextmanager, suppress
+from functools import lru_cache
+from itertools import groupby
+import atexit
+import csv
+import io
 import os
+import queue
+import sys
+import tempfile
+import threading
+import time
 
 app = Flask(__name__)
+Compress(app)  # gzip/br สำหรับ HTML ที่ส่วนใหญ่เป็นข้อความซ้ำ ๆ
 
 # -----------------------------
 # 0) PATH & FILE CONFIG
 # -----------------------------
 BASE_DIR = Path(__file__).resolve().parent
 DB_FILE = str(BASE_DIR / "tasks.db")
-EXCEL_FILE = str(BASE_DIR / "task_done_log.xlsx")
+EXPORT_NAME = "task_done_log_export.xlsx"
+# log แบบ Excel เดิม (ก่อนย้ายมาใช้ CSV) ถูกนำเข้าโดย --migrate แล้วเปลี่ยนชื่อเก็บไว้
+LEGACY_EXCEL_FILE = str(BASE_DIR / "task_done_log.xlsx")
+LEGACY_IMPORTED_FILE = str(BASE_DIR / "task_done_log.imported.xlsx")
+CSV_LOG_FILE = str(BASE_DIR / "task_done_log.csv")
+UNASSIGNED = "ไม่ระบุ"
+PERSON_KEY_SQL = f"COALESCE(person, '{UNASSIGNED}')"
 
 # -----------------------------
 # 1) DATABASE HELPERS
 # -----------------------------
+POOL_SIZE = 8
+_POOL: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=POOL_SIZE)
+
+def _open_conn() -> sqlite3.Connection:
+    # autocommit; ฟังก์ชันที่ต้องการ transaction จะ BEGIN เอง
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+    # ค่าพวกนี้มีผลราย connection จึงต้องตั้งทุกครั้งที่เปิดใหม่
+    conn.executescript("PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=5000; PRAGMA temp_store=MEMORY;")
+    return conn
+
+@contextmanager
+def get_conn() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection; commits on success, rolls back on error."""
+    conn = _POOL.get()
+    try:
+        with conn:
+            yield conn
+    finally:
+        _POOL.put(conn)
+
 def init_db():
-    with sqlite3.connect(DB_FILE) as conn:
+    with get_conn() as conn:
         conn.execute("""
         CREATE TABLE IF NOT EXISTS tasks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             person TEXT,
-            category TEXT,
+            category TEXT DEFAULT 'UNCATEGORIZED',
             done_count INTEGER DEFAULT 0
         )""")
+        # ต้องเป็น expression เดียวกับ ORDER BY ใน fetch_tasks ไม่งั้น SQLite จะไม่ใช้ index นี้
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_person_id ON tasks({PERSON_KEY_SQL}, id DESC)")
 
-def ensure_columns():
-    with sqlite3.connect(DB_FILE) as conn:
+def migrate_db():
+    """One-shot upgrade for tasks.db files created before category/done_count existed."""
+    with get_conn() as conn:
         cols = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
         if "category" not in cols:
-            conn.execute("ALTER TABLE tasks ADD COLUMN category TEXT")
+            conn.execute("ALTER TABLE tasks ADD COLUMN category TEXT DEFAULT 'UNCATEGORIZED'")
         if "done_count" not in cols:
             conn.execute("ALTER TABLE tasks ADD COLUMN done_count INTEGER DEFAULT 0")
 
+FORM_CATEGORIES = frozenset({"MALE OPERATION", "PROJECT"})
+
 def add_task(name: str, person: Optional[str], category: Optional[str]):
-    name = (name or "").strip()[:120]
-    person = (person or "").strip()[:60] or None
-    category = (category or "").strip().upper() or "UNCATEGORIZED"
+    # ตัดความยาวก่อน strip เพื่อจำกัดงานกับ input ที่ยาวผิดปกติ
+    name = (name or "")[:120].strip()
+    person = (person or "")[:60].strip() or None
+    if category not in FORM_CATEGORIES:  # ค่าจาก <select> เป็นตัวพิมพ์ใหญ่อยู่แล้ว
+        category = (category or "").strip().upper() or "UNCATEGORIZED"
     if not name:
         return
-    with sqlite3.connect(DB_FILE) as conn:
+    with get_conn() as conn:
         cur = conn.execute("INSERT INTO tasks (name, person, category) VALUES (?, ?, ?)",
                            (name, person, category))
         tid = cur.lastrowid
-    log_to_excel("create", tid, name, person, None, category)
+    queue_log("create", tid, name, person, None, category)
+
+# ข้อความ SQL คงที่ต่อจำนวน id จึงโดน statement cache ของ connection ใน pool ซ้ำได้
+# UPDATE ... RETURNING ต้องใช้ SQLite 3.35+ (ตรวจใน bootstrap)
+_DONE_UPD_STMT = ("UPDATE tasks SET done_count = COALESCE(done_count,0)+1 WHERE id IN (%s) "
+                  "RETURNING id, name, person, done_count, category")
+_DELETE_STMT = "DELETE FROM tasks WHERE id IN (%s)"
+# DELETE ... RETURNING คำสั่งเดียว: ถ้า BEGIN แล้ว SELECT ก่อน DELETE ใน WAL snapshot ที่อ่านไว้อาจเก่า
+# ทำให้ได้ SQLITE_BUSY_SNAPSHOT ("database is locked") ทันทีโดยไม่รอ busy_timeout
+_DELETE_RET_STMT = _DELETE_STMT + " RETURNING id, name, person, category"
 
-def delete_tasks(ids: List[str]):
+@lru_cache(maxsize=64)
+def _qmarks(n: int) -> str:
+    return ",".join("?" * n)
+
+def delete_tasks(ids: List[int]):
     if not ids:
         return
-    qmarks = ",".join("?" * len(ids))
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(f"SELECT * FROM tasks WHERE id IN ({qmarks})", ids).fetchall()
-        conn.executemany("DELETE FROM tasks WHERE id = ?", [(x,) for x in ids])
-    for r in rows:
-        log_to_excel("delete", r["id"], r["name"], r["person"], None, r["category"])
-
-def mark_tasks_done(ids: List[str]):
+    qmarks = _qmarks(len(ids))
+    with get_conn() as conn:
+        rows = conn.execute(_DELETE_RET_STMT % qmarks, ids).fetchall()
+    queue_log_many([("delete", rid, name, person, None, cat) for rid, name, person, cat in rows])
+
+def mark_tasks_done(ids: List[int]):
     if not ids:
         return
-    qmarks = ",".join("?" * len(ids))
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.row_factory = sqlite3.Row
-        for tid in ids:
-            conn.execute("UPDATE tasks SET done_count = COALESCE(done_count,0)+1 WHERE id=?", (tid,))
-        rows = conn.execute(f"SELECT * FROM tasks WHERE id IN ({qmarks})", ids).fetchall()
-        conn.executemany("DELETE FROM tasks WHERE id=?", [(x,) for x in ids])
-    for r in rows:
-        log_to_excel("done", r["id"], r["name"], r["person"], r["done_count"], r["category"])
+    qmarks = _qmarks(len(ids))
+    with get_conn() as conn:
+        conn.execute("BEGIN")
+        rows = conn.execute(_DONE_UPD_STMT % qmarks, ids).fetchall()
+        conn.execute(_DELETE_STMT % qmarks, ids)
+    queue_log_many([("done", rid, name, person, done_count, cat)
+                    for rid, name, person, done_count, cat in rows])
+
+def tasks_signature() -> Tuple[int, int]:
+    # id เป็น AUTOINCREMENT ไม่ถูกใช้ซ้ำ: เพิ่มงานทำให้ MAX(id) เปลี่ยน ลบ/ทำเสร็จทำให้ COUNT เปลี่ยน
+    with get_conn() as conn:
+        return conn.execute("SELECT COALESCE(MAX(id),0), COUNT(*) FROM tasks").fetchone()
 
 def fetch_tasks() -> List[Tuple[int, str, Optional[str], Optional[str]]]:
-    with sqlite3.connect(DB_FILE) as conn:
-        return conn.execute("SELECT id,name,person,category FROM tasks ORDER BY id DESC").fetchall()
+    with get_conn() as conn:
+        return conn.execute("SELECT id,name,person,category FROM tasks "
+                            f"ORDER BY {PERSON_KEY_SQL} ASC, id DESC").fetchall()
 
 # -----------------------------
-# 2) EXCEL LOGGING
+# 2) ACTION LOG (CSV) + EXCEL EXPORT
 # -----------------------------
-def log_to_excel(action, tid, name, person, done_count=None, category=None):
+LOG_HEADER = ["timestamp", "action", "task_id", "name", "person", "done_count", "category"]
+SHEET_HEADER = LOG_HEADER[:-1]
+NUMERIC_COLS = (LOG_HEADER.index("task_id"), LOG_HEADER.index("done_count"))
+CATEGORY_SHEETS = ["MALE OPERATION", "PROJECT", "UNCATEGORIZED"]
+# ออกแบบให้มี writer thread เดียวต่อไฟล์ log: รันแค่ 1 process (gunicorn -w 1 --threads N)
+LOG_QUEUE: "queue.Queue[List[tuple]]" = queue.Queue()
+# แต่ละแถวถูก write() ลงไฟล์ทันที (line-buffered) process ตายกะทันหันก็ไม่หาย
+# ที่หน่วงไว้คือ fsync เท่านั้น: ไฟดับ/OS crash อาจเสียได้ไม่เกิน LOG_SYNC_ROWS แถว / LOG_SYNC_SECS วินาที
+LOG_SYNC_ROWS = 50
+LOG_SYNC_SECS = 2.0
+_LOG_FILES: Dict[str, tuple] = {}  # path -> (file, csv.writer), เปิดค้างไว้ตลอดอายุ process
+_LOG_LOCK = threading.Lock()
+
+def sheet_csv_file(sheet: str) -> str:
+    return str(BASE_DIR / f"task_done_log_{sheet.replace(' ', '_')}.csv")
+
+# หมวด -> ชื่อชีต และชื่อชีต -> ไฟล์ CSV คำนวณไว้ครั้งเดียว
+_SHEET_MAP = {"MALE OPERATION": "MALE OPERATION", "PROJECT": "PROJECT"}
+_SHEET_FILES = {sheet: sheet_csv_file(sheet) for sheet in CATEGORY_SHEETS}
+
+def _csv_writer(path: str, header: List[str]):
+    entry = _LOG_FILES.get(path)
+    if entry is None:
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        f = open(path, "a", buffering=1, newline="", encoding="utf-8")
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(header)
+        entry = _LOG_FILES[path] = (f, writer)
+    return entry[1]
+
+def sync_logs():
+    with _LOG_LOCK:
+        for f, _ in _LOG_FILES.values():
+            os.fsync(f.fileno())
+
+def log_row(now, action, tid, name, person, done_count=None, category=None):
+    # ผู้เรียกต้องถือ _LOG_LOCK อยู่แล้ว
     cat = (category or "UNCATEGORIZED").upper()
-    path = Path(EXCEL_FILE)
-    if path.exists():
-        wb = load_workbook(path)
-    else:
-        wb = Workbook()
+    sheet_file = _SHEET_FILES[_SHEET_MAP.get(cat, "UNCATEGORIZED")]
     # ชีตรวม
-    if "Tasks_Log" not in wb.sheetnames:
-        ws = wb.create_sheet("Tasks_Log", 0)
-        ws.append(["timestamp", "action", "task_id", "name", "person", "done_count", "category"])
-    else:
-        ws = wb["Tasks_Log"]
-    now = datetime.now().isoformat(timespec="seconds")
-    ws.append([now, action, tid or "", name, person or "", done_count or "", cat])
+    _csv_writer(CSV_LOG_FILE, LOG_HEADER).writerow(
+        [now, action, tid or "", name, person or "", done_count or "", cat])
     # แยกชีตตามหมวด
-    valid = {"MALE OPERATION", "PROJECT"}
-    sheet = cat if cat in valid else "UNCATEGORIZED"
-    if sheet not in wb.sheetnames:
-        ws2 = wb.create_sheet(sheet)
-        ws2.append(["timestamp", "action", "task_id", "name", "person", "done_count"])
-    else:
-        ws2 = wb[sheet]
-    ws2.append([now, action, tid or "", name, person or "", done_count or ""])
-    wb.save(path)
+    _csv_writer(sheet_file, SHEET_HEADER).writerow(
+        [now, action, tid or "", name, person or "", done_count or ""])
+
+def log_many(entries):
+    with _LOG_LOCK:
+        for e in entries:
+            log_row(*e)
+
+def queue_log(action, tid, name, person, done_count=None, category=None):
+    """Stamp the action now and hand it to the log writer thread."""
+    queue_log_many([(action, tid, name, person, done_count, category)])
+
+def queue_log_many(entries):
+    """Like queue_log, but for a batch of (action, tid, name, person, done_count, category)."""
+    if not entries:
+        return
+    now = datetime.now().isoformat(timespec="seconds")
+    LOG_QUEUE.put([(now, *e) for e in entries])
+
+def _sync_logs_in_worker():
+    # fsync พัง (เช่น ENOSPC/EIO) ต้องไม่ทำให้ writer thread ตาย ไม่งั้นคิวจะค้างและ export/atexit จะรอตลอดไป
+    try:
+        sync_logs()
+    except OSError:
+        app.logger.exception("failed to fsync log files")
+
+def _log_worker():
+    # fsync เมื่อค้างครบ LOG_SYNC_ROWS แถว หรือแถวแรกที่ยังไม่ sync รอนานเกิน LOG_SYNC_SECS
+    pending, first_pending = 0, 0.0
+    while True:
+        timeout = None if not pending else max(0.0, first_pending + LOG_SYNC_SECS - time.monotonic())
+        try:
+            batch = LOG_QUEUE.get(timeout=timeout)
+        except queue.Empty:
+            _sync_logs_in_worker()
+            pending = 0
+            continue
+        try:
+            log_many(batch)
+            if not pending:
+                first_pending = time.monotonic()
+            pending += len(batch)
+        except Exception:
+            app.logger.exception("failed to write log rows %r", batch)
+        finally:
+            LOG_QUEUE.task_done()
+        if pending >= LOG_SYNC_ROWS or (pending and time.monotonic() - first_pending >= LOG_SYNC_SECS):
+            _sync_logs_in_worker()
+            pending = 0
+
+def _shutdown_logs():
+    LOG_QUEUE.join()
+    sync_logs()
+
+def export_excel() -> str:
+    """Build the XLSX in a new temp file and return its path; the caller deletes it."""
+    LOG_QUEUE.join()  # ให้แถวที่ค้างอยู่ในคิวลงไฟล์ก่อน
+    # ไฟล์แยกต่อ request เพื่อไม่ให้ export ที่ทำพร้อมกันเขียนทับไฟล์ที่อีก request กำลังส่งอยู่
+    fd, out_path = tempfile.mkstemp(prefix="task_done_log_export_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        # constant_memory เขียนทีละแถวลงไฟล์ ใช้หน่วยความจำคงที่ไม่ว่า log จะยาวแค่ไหน
+        wb = xlsxwriter.Workbook(out_path, {"constant_memory": True})
+        sources = [("Tasks_Log", CSV_LOG_FILE, LOG_HEADER)]
+        sources += [(sheet, path, SHEET_HEADER) for sheet, path in _SHEET_FILES.items()]
+        for title, path, header in sources:
+            ws = wb.add_worksheet(title)
+            if not os.path.exists(path):
+                ws.write_row(0, 0, header)
+                continue
+            with open(path, newline="", encoding="utf-8") as f:
+                for i, row in enumerate(csv.reader(f)):
+                    # CSV ให้มาเป็น str ทั้งหมด แปลง task_id/done_count กลับเป็นตัวเลขเหมือน log Excel เดิม
+                    for col in NUMERIC_COLS:
+                        if i and col < len(row) and row[col].isdigit():
+                            row[col] = int(row[col])
+                    ws.write_row(i, 0, row)
+        wb.close()
+    except Exception:
+        os.remove(out_path)
+        raise
+    return out_path
+
+def import_legacy_log() -> int:
+    """One-shot copy of the old task_done_log.xlsx history in front of the CSV logs."""
+    if not os.path.exists(LEGACY_EXCEL_FILE):
+        return 0
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        sys.exit("openpyxl is required to import task_done_log.xlsx: pip install openpyxl")
+    LOG_QUEUE.join()
+    wb = load_workbook(LEGACY_EXCEL_FILE, read_only=True)
+    targets = [("Tasks_Log", CSV_LOG_FILE, LOG_HEADER)]
+    targets += [(sheet, path, SHEET_HEADER) for sheet, path in _SHEET_FILES.items()]
+    imported = 0
+    with _LOG_LOCK:
+        for title, path, header in targets:
+            entry = _LOG_FILES.pop(path, None)
+            if entry is not None:
+                entry[0].close()
+            tmp = path + ".tmp"
+            with open(tmp, "w", newline="", encoding="utf-8") as out:
+                writer = csv.writer(out)
+                writer.writerow(header)
+                if title in wb.sheetnames:
+                    for row in wb[title].iter_rows(min_row=2, values_only=True):
+                        if all(v is None for v in row):
+                            continue
+                        writer.writerow(["" if v is None else v for v in row[:len(header)]])
+                        imported += title == "Tasks_Log"
+                # แถวที่ลง CSV หลังอัปเกรดแล้วต่อท้ายประวัติเดิม
+                if os.path.exists(path):
+                    with open(path, newline="", encoding="utf-8") as f:
+                        reader = csv.reader(f)
+                        next(reader, None)
+                        writer.writerows(reader)
+            os.replace(tmp, path)
+    wb.close()
+    os.replace(LEGACY_EXCEL_FILE, LEGACY_IMPORTED_FILE)
+    return imported
 
 # -----------------------------
 # 3) GROUP TASKS BY PERSON
 # -----------------------------
 def group_tasks_by_person(tasks):
-    groups = defaultdict(list)
-    for t in tasks:
-        tid, name, person, cat = t
-        groups[person or "ไม่ระบุ"].append(t)
-    result = []
-    for i, (person, items) in enumerate(sorted(groups.items())):
-        result.append({"gid": i, "person": person, "items": items})
-    return result
+    # tasks ต้องเรียงตามคนมาแล้วจาก fetch_tasks จึง groupby รอบเดียวได้
+    return [{"gid": i, "person": person, "items": list(items)}
+            for i, (person, items) in enumerate(groupby(tasks, key=lambda t: t[2] or UNASSIGNED))]
 
 # -----------------------------
 # 4) HTML TEMPLATE
 # -----------------------------
-HTML = """
+# ส่วนหัว/ฟอร์ม/สไตล์เป็น HTML คงที่ ใช้ Jinja เฉพาะส่วนรายการงาน
+HEAD_HTML = """
 <!DOCTYPE html>
 <html lang="th">
 <head>
@@ -209,6 +404,9 @@ HTML = """
   <!-- รายการงาน -->
   <form method="POST" id="listForm">
     <input type="hidden" name="action" value="done">
+"""
+
+GROUPS_HTML = """\
     {% if groups|length == 0 %}
       <div class="card"><div style="text-align:center;color:#666;">ยังไม่มีงาน</div></div>
     {% else %}
@@ -220,7 +418,7 @@ HTML = """
           {% set tid=t[0] %}{% set name=t[1] %}{% set cat=t[3] %}
           <div class="task">
             <div class="info">
-              <div><b>{{ loop.index }}.</b> {{ name }}</div>
+              <div><b class="num">{{ loop.index }}.</b> {{ name }}</div>
               <div class="person">หมวด: {{ cat }}</div>
             </div>
             <input type="checkbox" name="ids" value="{{ tid }}">
@@ -234,14 +432,62 @@ HTML = """
         <button class="danger" formaction="/delete" formmethod="POST">ลบงาน</button>
       </div>
     {% endif %}
+"""
+
+TAIL_HTML = """\
   </form>
+  <script>
+    // ส่ง done/delete เป็น JSON แล้วเอางานออกจากหน้าเลย ไม่ต้อง redirect โหลดทั้งหน้าใหม่
+    document.getElementById("listForm").addEventListener("submit", async (e) => {
+      const btn = e.submitter;
+      if (!btn || !window.fetch) return;  // browser เก่า: ส่งฟอร์มแบบเดิม
+      e.preventDefault();
+      const boxes = [...e.target.querySelectorAll('input[name="ids"]:checked')];
+      if (!boxes.length) return;
+      const url = btn.formAction.endsWith("/delete") ? "/api/delete" : "/api/done";
+      const res = await fetch(url, {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({ids: boxes.map((b) => b.value)}),
+      });
+      if (!res.ok) { location.reload(); return; }
+      boxes.forEach((b) => b.closest(".task").remove());
+      document.querySelectorAll("#listForm .person-group-container .card").forEach((card) => {
+        const nums = card.querySelectorAll(".num");
+        if (!nums.length) card.remove();
+        nums.forEach((n, i) => { n.textContent = (i + 1) + "."; });
+      });
+      if (!document.querySelector("#listForm .task")) location.reload();  // ให้ server render หน้ารายการว่าง
+    });
+  </script>
 </body>
 </html>
 """
 
+# คอมไพล์ template ครั้งเดียวตอนโหลดโมดูล ไม่ต้อง parse ใหม่ทุก request
+GROUPS_TPL = app.jinja_env.from_string(GROUPS_HTML)
+
+# (signature ของตาราง tasks, HTML ที่ render แล้ว)
+_PAGE_CACHE: Optional[Tuple[Tuple[int, int], str]] = None
+
 # -----------------------------
 # 5) ROUTES
 # -----------------------------
+SQLITE_MAX_INT = 2**63 - 1
+
+def _parse_ids(values) -> List[int]:
+    # ทิ้งค่าที่ไม่ใช่เลข id แล้ว bind เป็น int ให้ตรงกับ INTEGER PRIMARY KEY
+    # เช็คความยาวก่อน int() เพื่อไม่ให้เลขยาวมากทำให้ int() error และตัดค่าที่เกิน INTEGER ของ SQLite (int64)
+    ids = []
+    for x in values:
+        x = str(x)
+        if not (x.isascii() and x.isdigit()) or len(x.lstrip("0")) > 19:
+            continue
+        n = int(x)
+        if 0 < n <= SQLITE_MAX_INT:
+            ids.append(n)
+    return ids
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
@@ -249,24 +495,64 @@ def index():
         if action == "add":
             add_task(request.form.get("new_task"), request.form.get("person"), request.form.get("category"))
         elif action == "done":
-            mark_tasks_done(request.form.getlist("ids"))
+            mark_tasks_done(_parse_ids(request.form.getlist("ids")))
         return redirect("/")
-    tasks = fetch_tasks()
-    groups = group_tasks_by_person(tasks)
-    return render_template_string(HTML, groups=groups)
+    global _PAGE_CACHE
+    sig = tasks_signature()
+    cached = _PAGE_CACHE
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+    groups = group_tasks_by_person(fetch_tasks())
+    html = HEAD_HTML + GROUPS_TPL.render(groups=groups) + TAIL_HTML
+    _PAGE_CACHE = (sig, html)
+    return html
 
 @app.route("/delete", methods=["POST"])
 def delete_route():
-    delete_tasks(request.form.getlist("ids"))
+    delete_tasks(_parse_ids(request.form.getlist("ids")))
     return redirect("/")
 
+def _json_ids() -> List[int]:
+    data = request.get_json(silent=True)
+    ids = data.get("ids") if isinstance(data, dict) else None
+    return _parse_ids(ids if isinstance(ids, list) else [])
+
+@app.route("/api/done", methods=["POST"])
+def api_done():
+    mark_tasks_done(_json_ids())
+    return "", 204
+
+@app.route("/api/delete", methods=["POST"])
+def api_delete():
+    delete_tasks(_json_ids())
+    return "", 204
+
+class _DeleteOnClose(io.FileIO):
+    # response แบบ passthrough ไม่เรียก call_on_close จึงลบไฟล์ตอน server ปิดไฟล์ที่ส่งเสร็จแทน
+    def close(self):
+        super().close()
+        with suppress(FileNotFoundError):
+            os.remove(self.name)
+
+@app.route("/export")
+def export_route():
+    return send_file(_DeleteOnClose(export_excel()), as_attachment=True, download_name=EXPORT_NAME)
+
 # -----------------------------
 # 6) BOOTSTRAP
 # -----------------------------
 def bootstrap():
+    # mark_tasks_done ใช้ UPDATE ... RETURNING
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError(f"SQLite 3.35+ is required, found {sqlite3.sqlite_version}")
     os.makedirs(BASE_DIR, exist_ok=True)
+    for _ in range(POOL_SIZE):
+        _POOL.put(_open_conn())
+    with get_conn() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")  # ค่านี้ถูกบันทึกลงไฟล์ DB ตั้งครั้งเดียวพอ
     init_db()
-    ensure_columns()
+    threading.Thread(target=_log_worker, name="log-writer", daemon=True).start()
+    atexit.register(_shutdown_logs)
 
 bootstrap()
 
@@ -274,5 +560,10 @@ bootstrap()
 # 7) ENTRY POINT
 # -----------------------------
 if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        migrate_db()
+        print("✅ Database migrated")
+        print(f"✅ Imported {import_legacy_log()} rows from the old Excel log")
+        sys.exit(0)
     print("✅ Server running at http://127.0.0.1:5050")
     app.run(debug=True, host="127.0.0.1", port=5050)